@@ -6,12 +6,23 @@ Licensed under MIT License
 https://github.com/f0uriest/keras2c
  */
 
+#ifdef K2C_USE_MMAP
+#define _POSIX_C_SOURCE 200809L
+#endif
+
 #include <math.h>
 #include <stdio.h>
 #include <stdlib.h>
 #include <string.h>
 #include "k2c_include.h"
 
+#ifdef K2C_USE_MMAP
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+#endif
+
 
 /**
  * Just your basic 1d matrix multipication.
@@ -348,3 +359,108 @@ float* k2c_read_array(const char* filename, const size_t array_size) {
     fclose(finp);
     return ptr;
 }
+
+
+/**
+ * Reads array from binary file.
+ *
+ * :param filename: file to read from. Assumed raw native endian float32.
+ * :param array_size: how many values to read from the file.
+ * :return: pointer to allocated array.
+ */
+float* k2c_read_array_bin(const char* filename, const size_t array_size) {
+    float* ptr = (float*) malloc(array_size * sizeof(float));
+    if (!ptr) {
+        printf("cannot allocate memory %s \n", filename);
+        exit(-1);
+    }
+    FILE *finp;
+    finp = fopen(filename, "rb");
+    if(NULL == finp) {
+        printf("Unable to open file %s \n",filename);
+        exit(-1);
+    }
+    if (fread(ptr, sizeof(float), array_size, finp) != array_size) {
+        printf("Unable to read %zu values from file %s \n", array_size, filename);
+        exit(-1);
+    }
+    fclose(finp);
+    return ptr;
+}
+
+
+/**
+ * Converts little endian float32 values to host byte order in place.
+ * Does nothing on little endian hosts.
+ *
+ * :param ptr: array of values.
+ * :param array_size: number of values in the array.
+ */
+static void k2c_weights_to_host(float* ptr, const size_t array_size) {
+    const unsigned int one = 1;
+    if (*(const unsigned char*) &one) {
+        return;
+    }
+    unsigned char* bytes = (unsigned char*) ptr;
+    for (size_t i = 0; i < array_size; ++i) {
+        unsigned char* b = bytes + i*sizeof(float);
+        unsigned char tmp = b[0];
+        b[0] = b[3];
+        b[3] = tmp;
+        tmp = b[1];
+        b[1] = b[2];
+        b[2] = tmp;
+    }
+}
+
+
+/**
+ * Loads all weights of a model from a single binary file.
+ * If K2C_USE_MMAP is defined the file is memory mapped (copy on write),
+ * otherwise it is read into a single allocation.
+ *
+ * :param filename: file to read from. Assumed raw little endian float32.
+ * :param array_size: total number of values in the file.
+ * :return: pointer to the start of the weights. Release with k2c_free_weights.
+ */
+float* k2c_load_weights(const char* filename, const size_t array_size) {
+#ifdef K2C_USE_MMAP
+    int fd = open(filename, O_RDONLY);
+    if (fd < 0) {
+        printf("Unable to open file %s \n",filename);
+        exit(-1);
+    }
+    struct stat st;
+    if (fstat(fd, &st) != 0 || (size_t) st.st_size < array_size * sizeof(float)) {
+        printf("Unable to read %zu values from file %s \n", array_size, filename);
+        exit(-1);
+    }
+    void* ptr = mmap(NULL, array_size * sizeof(float), PROT_READ | PROT_WRITE,
+                     MAP_PRIVATE, fd, 0);
+    close(fd);
+    if (ptr == MAP_FAILED) {
+        printf("Unable to map file %s \n",filename);
+        exit(-1);
+    }
+#else
+    float* ptr = k2c_read_array_bin(filename, array_size);
+#endif
+    k2c_weights_to_host((float*) ptr, array_size);
+    return (float*) ptr;
+}
+
+
+/**
+ * Releases weights loaded with k2c_load_weights.
+ *
+ * :param ptr: pointer returned by k2c_load_weights.
+ * :param array_size: total number of values loaded.
+ */
+void k2c_free_weights(float* ptr, const size_t array_size) {
+#ifdef K2C_USE_MMAP
+    munmap(ptr, array_size * sizeof(float));
+#else
+    (void) array_size;
+    free(ptr);
+#endif
+}
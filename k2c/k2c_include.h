@@ -89,6 +89,9 @@ void k2c_dot(k2c_tensor* C, const k2c_tensor* A, const k2c_tensor* B, const size
 void k2c_bias_add(k2c_tensor* A, const k2c_tensor* b);
 void k2c_flip(k2c_tensor *A, const size_t axis);
 float* k2c_read_array(const char* filename, const size_t array_size);
+float* k2c_read_array_bin(const char* filename, const size_t array_size);
+float* k2c_load_weights(const char* filename, const size_t array_size);
+void k2c_free_weights(float* ptr, const size_t array_size);
 
 // Merge layers
 void k2c_add(k2c_tensor* output, const size_t num_tensors,...);
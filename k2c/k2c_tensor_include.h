@@ -17,6 +17,16 @@ https://github.com/f0uriest/keras2c
 #define K2C_MAX_NDIM 5
 
 
+/**
+ * Alignment for constant weight arrays, so they can be loaded with wide vector instructions.
+ */
+#if defined(__GNUC__) || defined(__clang__)
+#define K2C_ALIGNED __attribute__((aligned(64)))
+#else
+#define K2C_ALIGNED
+#endif
+
+
 /**
  * tensor type for keras2c.
  */
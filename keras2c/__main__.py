@@ -7,8 +7,9 @@ https://github.com/f0uriest/keras2c
 Runs keras2c
 """
 import argparse
+import json
 import sys
-from keras2c.keras2c_main import k2c
+from keras2c.keras2c_main import k2c, k2c_batch
 
 
 __author__ = "Rory Conlin"
@@ -25,15 +26,26 @@ def parse_args(args):
     parser = argparse.ArgumentParser(prog='keras2c',
                                      description="""A library for converting the forward pass (inference) part of a keras model to a C function""")
     parser.add_argument(
-        "model_path", help="File path to saved keras .h5 model file")
+        "model_path", nargs='?', help="File path to saved keras .h5 model file")
     parser.add_argument(
-        "function_name", help="What to name the resulting C function")
+        "function_name", nargs='?', help="What to name the resulting C function")
+    parser.add_argument("-b", "--batch",
+                        help="""JSON file with a list of [model_path, function_name] pairs to convert in one process, instead of a single model""", metavar='')
     parser.add_argument("-m", "--malloc", action="store_true",
-                        help="""Use dynamic memory for large arrays. Weights will be saved to .csv files that will be loaded at runtime""")
+                        help="""Use dynamic memory for large arrays. Weights will be saved to a binary file that will be loaded at runtime""")
+    parser.add_argument("-c", "--csv", action="store_true",
+                        help="""Save dynamically allocated weights to .csv text files instead of binary files""")
     parser.add_argument("-t", "--num_tests", type=int,
                         help="""Number of tests to generate. Default is 10""", metavar='')
+    parser.add_argument("-f", "--format", action="store_true",
+                        help="""Format the generated files with astyle""")
+    parser.add_argument("-o", "--out_dir", default='.',
+                        help="""Directory to write generated files to. Default is the current directory""", metavar='')
 
-    return parser.parse_args(args)
+    parsed = parser.parse_args(args)
+    if parsed.batch is None and (parsed.model_path is None or parsed.function_name is None):
+        parser.error("model_path and function_name are required unless --batch is given")
+    return parsed
 
 
 def main(args=sys.argv[1:]):
@@ -48,7 +60,16 @@ def main(args=sys.argv[1:]):
     else:
         num_tests = 10
 
-    k2c(args.model_path, args.function_name, malloc, num_tests)
+    if args.batch:
+        with open(args.batch) as f:
+            jobs = json.load(f)
+        k2c_batch(jobs, malloc=malloc, num_tests=num_tests,
+                  binary_weights=not args.csv, out_dir=args.out_dir,
+                  format_output=args.format)
+    else:
+        k2c(args.model_path, args.function_name, malloc, num_tests,
+            binary_weights=not args.csv, out_dir=args.out_dir,
+            format_output=args.format)
 
 
 if __name__ == '__main__':
@@ -40,6 +40,22 @@ def is_valid_c_name(name):
     return True
 
 
+def layer_name_check(layer):
+    """Checks if a layer name is a valid C name.
+
+    Args:
+       layer (keras Layer): layer to check
+
+    Returns:
+        valid (bool): 'True' if the name is valid, 'False' otherwise
+        log (str): log of invalid names
+    """
+
+    if not is_valid_c_name(layer.name):
+        return False, "layer name '" + layer.name + "' is not a valid C name. \n"
+    return True, ''
+
+
 def name_check(model):
     """Checks if all layer names in a model are valid C names.
 
@@ -51,45 +67,85 @@ def name_check(model):
         log (str): log of invalid names
     """
 
+    return _check_all_layers(model, layer_name_check)
+
+
+def layer_supported_check(layer, metadata=None):
+    """Checks if a layer, and any layer it wraps, is supported
+
+    Args:
+       layer (keras Layer): layer to check
+       metadata (dict): optional model metadata from precompute_model_metadata
+
+    Returns:
+        valid (bool): 'True' if the layer is supported, 'False' otherwise
+        log (str): log of unsupported layers
+    """
+
     valid = True
     log = ''
-    for layer in model.layers:
-        if not is_valid_c_name(layer.name):
-            valid = False
-            log += "layer name '" + layer.name + "' is not a valid C name. \n"
+    if hasattr(layer, 'layer'):
+        flag, templog = layer_supported_check(layer.layer)
+        valid = valid and flag
+        log += templog
+    ltype = layer_type(layer, metadata)
+    if not hasattr(Weights2C, '_write_weights_' + ltype) \
+       or not hasattr(Layers2C, '_write_layer_' + ltype):
+        valid = False
+        log += ltype + "' is not supported at this time. \n"
     return valid, log
 
 
-def layers_supported_check(model):
+def layers_supported_check(model, metadata=None):
     """Checks if all layers in the model are supported
 
     Args:
        model (keras Model): model to check
+       metadata (dict): optional model metadata from precompute_model_metadata
 
     Returns:
         valid (bool): 'True' if all layers are supported, 'False' otherwise
         log (str): log of unsupported layers
     """
 
-    def check_layer(layer):
-        valid = True
-        log = ''
-        if hasattr(layer, 'layer'):
-            flag, templog = check_layer(layer.layer)
-            valid = valid and flag
-            log += templog
-        if not hasattr(Weights2C, '_write_weights_' + layer_type(layer)) \
-           or not hasattr(Layers2C, '_write_layer_' + layer_type(layer)):
-            valid = False
-            log += layer_type(layer) + "' is not supported at this time. \n"
-        return valid, log
+    return _check_all_layers(model, layer_supported_check, metadata)
+
+
+def layer_activation_check(layer):
+    """Checks if the activation functions of a layer, and any layer it wraps, are supported
+
+    Args:
+       layer (keras Layer): layer to check
+
+    Returns:
+        valid (bool): 'True' if all activations are supported, 'False' otherwise
+        log (str): log of unsupported activation functions
+    """
+
+    supported_activations = ['linear', 'relu', 'softmax', 'softplus',
+                             'softsign', 'relu', 'tanh', 'sigmoid',
+                             'hard_sigmoid', 'exponential']
 
     valid = True
     log = ''
-    for layer in model.layers:
-        flag, templog = check_layer(layer)
+    if hasattr(layer, 'layer'):
+        flag, templog = layer_activation_check(layer.layer)
         valid = valid and flag
         log += templog
+    activation = layer.get_config().get('activation')
+    recurrent_activation = layer.get_config().get('recurrent_activation')
+    if activation not in supported_activations and activation is not None:
+        valid = False
+        log += "activation type '" + layer.get_config()['activation'] + \
+               "' for layer '" + layer.name + \
+               "' is not supported at this time. \n"
+    if recurrent_activation not in supported_activations and \
+       recurrent_activation is not None:
+        valid = False
+        log += "recurrent activation type '" + \
+               layer.get_config()['recurrent_activation'] + \
+               "' for layer '" + layer.name + \
+               "' is not supported at this time. \n"
     return valid, log
 
 
@@ -104,116 +160,125 @@ def activation_supported_check(model):
         log (str): log of unsupported activation functions
     """
 
-    supported_activations = ['linear', 'relu', 'softmax', 'softplus',
-                             'softsign', 'relu', 'tanh', 'sigmoid',
-                             'hard_sigmoid', 'exponential']
+    return _check_all_layers(model, layer_activation_check)
 
-    def check_layer(layer):
-        valid = True
-        log = ''
-        if hasattr(layer, 'layer'):
-            flag, templog = check_layer(layer.layer)
-            valid = valid and flag
-            log += templog
-        activation = layer.get_config().get('activation')
-        recurrent_activation = layer.get_config().get('recurrent_activation')
-        if activation not in supported_activations and activation is not None:
-            valid = False
-            log += "activation type '" + layer.get_config()['activation'] + \
-                   "' for layer '" + layer.name + \
-                   "' is not supported at this time. \n"
-        if recurrent_activation not in supported_activations and \
-           recurrent_activation is not None:
-            valid = False
-            log += "recurrent activation type '" + \
-                   layer.get_config()['recurrent_activation'] + \
-                   "' for layer '" + layer.name + \
-                   "' is not supported at this time. \n"
-        return valid, log
+# add check for masking
+
+
+def layer_config_check(layer, metadata=None):
+    """Checks if all features of a layer, and any layer it wraps, are supported
+
+    Args:
+       layer (keras Layer): layer to check
+       metadata (dict): optional model metadata from precompute_model_metadata
+
+    Returns:
+        valid (bool): 'True' if all features are supported, 'False' otherwise
+        log (str): log of unsupported features
+    """
 
     valid = True
     log = ''
-    for layer in model.layers:
-        flag, templog = check_layer(layer)
+    if hasattr(layer, 'layer'):
+        flag, templog = layer_config_check(layer.layer)
         valid = valid and flag
         log += templog
+    config = layer.get_config()
+    if config.get('merge_mode', 'foo') is None:
+        valid = False
+        log += "merge mode of 'None' for Bidirectional layers is not " +\
+               "supported. Try using two seperate RNNs instead"
+    if config.get('data_format') not in ['channels_last', None]:
+        valid = False
+        log += "data format '" + layer.get_config()['data_format'] +\
+               "' for layer '" + layer.name + \
+               "' is not supported at this time. \n"
+    if config.get('return_state'):
+        valid = False
+        log += "'return_state' option for layer '" + layer.name + \
+               "' is not supported at this time. \n"
+    if config.get('shared_axes'):
+        valid = False
+        log += "shared axes option for layer '" + layer.name + \
+               "' is not supported at this time. \n"
+    ltype = layer_type(layer, metadata)
+    if ltype in ['Add', 'Subtract', 'Multiply', 'Average',
+                 'Maximum', 'Minimum']:
+
+        # inshps = layer.input[0].shape
+        # inshps = np.(inshps)
+        inshps = [i.shape for i in layer.input]
+        inshps = tuple(x for x in inshps if x is not None)
+
+        insize = [np.prod(inp) for inp in inshps]
+        if len(set(insize)) > 1:
+            valid = False
+            log += "broadcasting merge functions between tensors" + \
+                   " of different shapes for layer '" + \
+                   layer.name + "' is not currently supported. \n"
+    if ltype in ['BatchNormalizationV1', 'BatchNormalization']:
+        if len(flatten(config.get('axis'))) > 1:
+            valid = False
+            log += 'batch normalization along multiple axes is' + \
+                   ' not currently supported. \n'
     return valid, log
 
-# add check for masking
-
 
-def config_supported_check(model):
+def config_supported_check(model, metadata=None):
     """Checks if all layer features in the model are supported
 
     Args:
        model (keras Model): model to check
+       metadata (dict): optional model metadata from precompute_model_metadata
 
     Returns:
         valid (bool): 'True' if all features are supported, 'False' otherwise
         log (str): log of unsupported features
     """
 
-    def check_layer(layer):
-        valid = True
-        log = ''
-        if hasattr(layer, 'layer'):
-            flag, templog = check_layer(layer.layer)
-            valid = valid and flag
-            log += templog
-        config = layer.get_config()
-        if config.get('merge_mode', 'foo') is None:
-            valid = False
-            log += "merge mode of 'None' for Bidirectional layers is not " +\
-                   "supported. Try using two seperate RNNs instead"
-        if config.get('data_format') not in ['channels_last', None]:
-            valid = False
-            log += "data format '" + layer.get_config()['data_format'] +\
-                   "' for layer '" + layer.name + \
-                   "' is not supported at this time. \n"
-        if config.get('return_state'):
-            valid = False
-            log += "'return_state' option for layer '" + layer.name + \
-                   "' is not supported at this time. \n"
-        if config.get('shared_axes'):
-            valid = False
-            log += "shared axes option for layer '" + layer.name + \
-                   "' is not supported at this time. \n"
-        if layer_type(layer) in ['Add', 'Subtract', 'Multiply', 'Average',
-                                 'Maximum', 'Minimum']:
-
-            # inshps = layer.input[0].shape
-            # inshps = np.(inshps)
-            inshps = [i.shape for i in layer.input]
-            inshps = tuple(x for x in inshps if x is not None)
-
-            insize = [np.prod(inp) for inp in inshps]
-            if len(set(insize)) > 1:
-                valid = False
-                log += "broadcasting merge functions between tensors" + \
-                       " of different shapes for layer '" + \
-                       layer.name + "' is not currently supported. \n"
-        if layer_type(layer) in ['BatchNormalizationV1', 'BatchNormalization']:
-            if len(flatten(config.get('axis'))) > 1:
-                valid = False
-                log += 'batch normalization along multiple axes is' + \
-                       ' not currently supported. \n'
-        return valid, log
+    return _check_all_layers(model, layer_config_check, metadata)
+
+
+def check_layer(layer, metadata=None):
+    """Runs all per layer checks on a single layer
+
+    Args:
+       layer (keras Layer): layer to check
+       metadata (dict): optional model metadata from precompute_model_metadata
+
+    Returns:
+        valid (bool): 'True' if the layer can be converted, 'False' otherwise
+        log (str): log of invalid names and unsupported features
+    """
+
+    valid = True
+    log = ''
+    for flag, templog in (layer_name_check(layer),
+                          layer_supported_check(layer, metadata),
+                          layer_activation_check(layer),
+                          layer_config_check(layer, metadata)):
+        valid = valid and flag
+        log += templog
+    return valid, log
+
 
+def _check_all_layers(model, check, *args):
     valid = True
     log = ''
     for layer in model.layers:
-        flag, templog = check_layer(layer)
+        flag, templog = check(layer, *args)
         valid = valid and flag
         log += templog
     return valid, log
 
 
-def check_model(model, function_name):
+def check_model(model, function_name, metadata=None):
     """Checks if all names are valid and all features are supported
 
     Args:
         model (keras Model): model to check
         function_name (str): name of the function being created
+        metadata (dict): optional model metadata from precompute_model_metadata
 
     Raises:
         AssertionError: If model contains invalid names or unsupported features
@@ -226,11 +291,11 @@ def check_model(model, function_name):
         log += "function name '" + function_name + "' is not a valid C name. \n"
     valid_lname, name_log = name_check(model)
     log += name_log
-    valid_layer, layer_log = layers_supported_check(model)
+    valid_layer, layer_log = layers_supported_check(model, metadata)
     log += layer_log
     valid_activation, activation_log = activation_supported_check(model)
     log += activation_log
-    valid_config, config_log = config_supported_check(model)
+    valid_config, config_log = config_supported_check(model, metadata)
     log += config_log
     if not (valid_fname and valid_lname and valid_layer and
             valid_activation and valid_config):
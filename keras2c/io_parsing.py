@@ -7,6 +7,9 @@ https://github.com/f0uriest/keras2c
 Helper functions to get input and output names for each layer etc.
 """
 
+# imports
+from tensorflow.keras.layers import InputLayer
+
 __author__ = "Rory Conlin"
 __copyright__ = "Copyright 2020, Rory Conlin"
 __license__ = "MIT"
@@ -14,103 +17,145 @@ __maintainer__ = "Rory Conlin, https://github.com/f0uriest/keras2c"
 __email__ = "wconlin@princeton.edu"
 
 
-def layer_type(layer):
+def precompute_model_metadata(model):
+    """Gathers the type and io info of every layer in a single pass over the model
+
+    Args:
+        model (keras Model): model to parse
+
+    Returns:
+        metadata (dict): per layer info keyed by layer name. Each entry is a dict
+            with keys "layer", "type", "inputs", "outputs", "num_inputs" and
+            "num_outputs". Only the top level layers in model.layers are included.
+    """
+
+    return {layer.name: layer_metadata(layer) for layer in model.layers}
+
+
+def layer_metadata(layer):
+    """Gathers the type and io info of a single layer
+
+    Args:
+        layer (keras Layer): layer you want to parse
+
+    Returns:
+        entry (dict): dict with keys "layer", "type", "inputs", "outputs",
+            "num_inputs" and "num_outputs"
+    """
+
+    ltype = type(layer).__name__
+    if isinstance(layer, InputLayer):
+        inputs, outputs = [], []
+    else:
+        inputs, outputs = [layer.input.name], [layer.output.name]
+    try:
+        num_inputs = layer.input.shape[1]
+    except:
+        num_inputs = 0
+    try:
+        num_outputs = layer.output.shape[1]
+    except:
+        num_outputs = 0
+    return {"layer": layer, "type": ltype, "inputs": inputs, "outputs": outputs,
+            "num_inputs": num_inputs, "num_outputs": num_outputs}
+
+
+def _lookup(layer, metadata=None):
+    """Gets the cached metadata entry for a layer, or None if it is not cached
+
+    Wrapped sub-layers (eg the inner layer of TimeDistributed) are not in
+    model.layers and their names need not be unique, so an entry only counts
+    if it belongs to this exact layer object.
+    """
+
+    if metadata is None:
+        return None
+    entry = metadata.get(layer.name)
+    if entry is None or entry["layer"] is not layer:
+        return None
+    return entry
+
+
+def _get_entry(layer, metadata=None):
+    """Gets the metadata entry for a layer, computing it if it is not cached
+    """
+
+    if isinstance(layer, dict):
+        return layer
+    entry = _lookup(layer, metadata)
+    if entry is None:
+        entry = layer_metadata(layer)
+    return entry
+
+
+def layer_type(layer, metadata=None):
     """Gets the type of a layer
 
     Args:
-        layer (keras Layer): layer you want the type of
+        layer (keras Layer or dict): layer you want the type of, or its metadata entry
+        metadata (dict): optional model metadata from precompute_model_metadata
 
     Returns:
         type (str): what kind of layer it is. Eg "Dense", "Conv2D", "SimpleRNN"
     """
 
-    return layer.__class__.__name__
+    if isinstance(layer, dict):
+        return layer["type"]
+    entry = _lookup(layer, metadata)
+    if entry is not None:
+        return entry["type"]
+    return type(layer).__name__
 
 
-def get_all_io_names(model):
+def get_all_io_names(model, metadata=None):
     """Gets names of all  node names in the model
 
     Args:
         model (keras Model): model to parse
+        metadata (dict): optional model metadata from precompute_model_metadata
 
     Returns:
         io (list): names of all the nodes in the model
     """
 
-    # a = [get_layer_io_names(layer) for layer in model.layers]
-
-    a = [get_layer_io_names(model.layers[0])]
-    for layer in model.layers:
-        __, output = get_layer_io_names(layer)
-        a.append(output)
-    a = list(set(flatten(a)))
+    if metadata is None:
+        metadata = precompute_model_metadata(model)
+    a = [get_layer_io_names(layer, metadata) for layer in model.layers]
+    a = unique(flatten(a))
 
     return a
 
 
-def get_layer_num_io(layer):
+def get_layer_num_io(layer, metadata=None):
     """Gets the number of inputs and outputs for a layer
 
     Args:
-        layer (keras Layer): layer you want to parse
+        layer (keras Layer or dict): layer you want to parse, or its metadata entry
+        metadata (dict): optional model metadata from precompute_model_metadata
 
     Returns:
         num_inputs (int): number of input nodes to the layer
         num_outputs (int): number of output nodes from the layer
     """
 
-    # num_inputs = 0
-    # error = False
-    # while not error:
-    #     try:
-            
-    #         layer.input(num_inputs)
-    #         num_inputs += 1
-    #     except :
-    #         error = True
-
-    # num_outputs = 0
-    # error = False
-    # while not error:
-    #     try:
-    #         layer.get_output_at(num_outputs)
-    #         num_outputs += 1
-    #     except :
-    #         error = True
-
-    try:
-        num_inputs = layer.input.shape[1]
-    except:
-        num_inputs = 0
-    try:
-        num_outputs = layer.output.shape[1]
-    except:
-        num_outputs = 0
-    return num_inputs, num_outputs
+    entry = _get_entry(layer, metadata)
+    return entry["num_inputs"], entry["num_outputs"]
 
 
-def get_layer_io_names(layer):
+def get_layer_io_names(layer, metadata=None):
     """Gets the names of the inputs and outputs of a layer
 
     Args:
-        layer (keras Layer): layer you want to parse
+        layer (keras Layer or dict): layer you want to parse, or its metadata entry
+        metadata (dict): optional model metadata from precompute_model_metadata
 
     Returns:
         inputs (list): names of all the input nodes to the layer
         outputs (list): names of all the output nodes from the layer
     """
-    # print("get_layer_io_name")
-    # print(layer)
-    # print(layer.input)
-    # print(layer.output)
-    # print(layer.name)
-    # print(layer_type(layer))
-    # print()
-    if(layer_type(layer) == "InputLayer"):
-    
-        return [], []    
-    
-    return [layer.input.name], [layer.output.name]
+
+    entry = _get_entry(layer, metadata)
+    return entry["inputs"], entry["outputs"]
 
 
 def get_model_io_names(model):
@@ -124,16 +169,11 @@ def get_model_io_names(model):
         outputs (list): names of all the output nodes
     """
 
-    num_inputs = len(model.inputs)
-    num_outputs = len(model.outputs)
-    inputs = []
-    outputs = []
-    for i in range(num_inputs):
-        nm = model.inputs[i].name.split(':')[0].split('/')[0]
-        inputs.append(nm)
-    for i in range(num_outputs):
-        nm = model.outputs[i].name.split(':')[0].split('/')[0]
-        outputs.append(nm)
+    def short_name(tensor):
+        return tensor.name.partition(':')[0].partition('/')[0]
+
+    inputs = [short_name(t) for t in model.inputs]
+    outputs = [short_name(t) for t in model.outputs]
     return inputs, outputs
 
 
@@ -146,7 +186,26 @@ def flatten(x):
     Returns:
         x (list): flattened input
     """
-    if isinstance(x, list) or isinstance(x, tuple):
-        return [a for i in x for a in flatten(i)]
-    else:
-        return [x]
+
+    out = []
+    stack = [x]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, (list, tuple)):
+            stack.extend(reversed(item))
+        else:
+            out.append(item)
+    return out
+
+
+def unique(x):
+    """Removes duplicates from a list, keeping the order of first appearance
+
+    Args:
+        x (list): list of hashable items
+
+    Returns:
+        x (list): input with duplicates removed
+    """
+
+    return list(dict.fromkeys(x))
@@ -9,14 +9,18 @@ Converts keras model to C code
 """
 
 # imports
-from keras2c.layer2c import Layers2C
-from keras2c.weights2c import Weights2C
+from keras2c.model_compiler import ModelCompiler
 from keras2c.io_parsing import layer_type, get_all_io_names, get_layer_io_names, \
-    get_model_io_names, flatten
-from keras2c.check_model import check_model
+    get_model_io_names, flatten, precompute_model_metadata
 from keras2c.make_test_suite import make_test_suite
 import numpy as np
+import hashlib
+import os
 import subprocess
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from tensorflow.keras import models
 
 __author__ = "Rory Conlin"
@@ -25,18 +29,41 @@ __license__ = "MIT"
 __maintainer__ = "Rory Conlin, https://github.com/f0uriest/keras2c"
 __email__ = "wconlin@princeton.edu"
 
+# buffer size for writing generated source files
+WRITE_BUFFER_SIZE = 1 << 20
+# max number of threads used to write weight files
+MAX_WRITE_WORKERS = 8
+# number of loaded models kept by cached_model, per process
+MODEL_CACHE_SIZE = 4
 
-def model2c(model, function_name, malloc=False, verbose=True):
+# loaded models keyed by hash of the saved file, least recently used first.
+# each entry is a dict with the model and a lock held while it is in use
+_model_cache = OrderedDict()
+_model_cache_lock = threading.Lock()
+
+
+def model2c(model, function_name, malloc=False, verbose=True, binary_weights=True,
+            metadata=None, out_dir='.', format_output=False):
     """Generates C code for model.
 
     Writes main function definition to "function_name.c" and a public header
-    with declarations to "function_name.h"
+    with declarations to "function_name.h" in out_dir. The model is checked
+    while the code is generated.
 
     Args:
         model (tf.keras.Model): Model to convert.
         function_name (str): Name of C function.
         malloc (bool): Whether to allocate variables on the stack or heap.
         verbose (bool): Whether to print info to stdout.
+        binary_weights (bool): Whether to save heap allocated weights to a single
+            raw little endian float32 binary file instead of one .csv text file each.
+        metadata (dict): Layer metadata from precompute_model_metadata. Computed
+            if not given.
+        out_dir (str): Directory to write generated files to.
+        format_output (bool): Whether to format the generated files with astyle.
+
+    Raises:
+        AssertionError: If model contains invalid names or unsupported features.
 
     Returns:
         malloc_vars (list): Names of variables loaded at runtime and stored on the heap.
@@ -49,53 +76,58 @@ def model2c(model, function_name, malloc=False, verbose=True):
     includes += '#include "./k2c/k2c_include.h" \n'
     includes += '#include "./k2c/k2c_tensor_include.h" \n\n'
 
+    if metadata is None:
+        metadata = precompute_model_metadata(model)
     if verbose:
-        print('Gathering Weights')
-    stack_vars, malloc_vars, static_vars = Weights2C(
-        model, function_name, malloc).write_weights(verbose)
+        print('Checking model and gathering weights')
+    compiler = ModelCompiler(model, function_name, malloc, metadata).run(verbose)
+    stack_vars = compiler.stack_vars
+    malloc_vars = compiler.malloc_vars
+    static_vars = compiler.static_vars
+    layers = compiler.layers_src
     stateful = len(static_vars) > 0
-    layers = Layers2C(model, malloc).write_layers(verbose)
-
-    function_signature = 'void ' + function_name + '('
-    function_signature += ', '.join(['k2c_tensor* ' +
-                                     in_nm + '_input' for in_nm in model_inputs]) + ', '
-    function_signature += ', '.join(['k2c_tensor* ' +
-                                     out_nm + '_output' for out_nm in model_outputs])
-    if len(malloc_vars.keys()):
-        function_signature += ',' + ','.join(['float* ' +
-                                              key for key in malloc_vars.keys()])
-    function_signature += ')'
-
-    init_sig, init_fun = gen_function_initialize(function_name, malloc_vars)
-    term_sig, term_fun = gen_function_terminate(function_name, malloc_vars)
+
+    function_signature = 'void ' + function_name + '(' + ', '.join(
+        ['k2c_tensor* ' + in_nm + '_input' for in_nm in model_inputs] +
+        ['k2c_tensor* ' + out_nm + '_output' for out_nm in model_outputs] +
+        ['float* ' + key for key in malloc_vars.keys()]) + ')'
+
+    init_sig, init_fun = gen_function_initialize(
+        function_name, malloc_vars, binary_weights, out_dir)
+    term_sig, term_fun = gen_function_terminate(
+        function_name, malloc_vars, binary_weights)
     reset_sig, reset_fun = gen_function_reset(function_name)
 
-    with open(function_name + '.c', 'w+') as source:
-        source.write(includes)
-        source.write(static_vars + '\n\n')
-        source.write(function_signature)
-        source.write(' { \n\n')
-        source.write(stack_vars)
-        source.write(layers)
-        source.write('\n } \n\n')
-        source.write(init_fun)
-        source.write(term_fun)
-        if stateful:
-            source.write(reset_fun)
-
-    with open(function_name + '.h', 'w+') as header:
-        header.write('#pragma once \n')
-        header.write('#include "./k2c/k2c_tensor_include.h" \n')
-        header.write(function_signature + '; \n')
-        header.write(init_sig + '; \n')
-        header.write(term_sig + '; \n')
-        if stateful:
-            header.write(reset_sig + '; \n')
-    try:
-        subprocess.run(['astyle', '-n', function_name + '.h'])
-        subprocess.run(['astyle', '-n', function_name + '.c'])
-    except FileNotFoundError:
-        print("astyle not found, {} and {} will not be auto-formatted".format(function_name + ".h", function_name + ".c"))
+    source_path = os.path.join(out_dir, function_name + '.c')
+    header_path = os.path.join(out_dir, function_name + '.h')
+    with open(source_path, 'w+', buffering=WRITE_BUFFER_SIZE) as source:
+        source.writelines([includes,
+                           static_vars + '\n\n',
+                           function_signature,
+                           ' { \n\n',
+                           stack_vars,
+                           layers,
+                           '\n } \n\n',
+                           init_fun,
+                           term_fun,
+                           reset_fun if stateful else ''])
+
+    with open(header_path, 'w+', buffering=WRITE_BUFFER_SIZE) as header:
+        header.writelines(['#pragma once \n',
+                           '#include "./k2c/k2c_tensor_include.h" \n',
+                           function_signature + '; \n',
+                           init_sig + '; \n',
+                           term_sig + '; \n',
+                           reset_sig + '; \n' if stateful else ''])
+    if format_output:
+        try:
+            # format header and source concurrently
+            procs = [subprocess.Popen(['astyle', '-n', fname])
+                     for fname in (header_path, source_path)]
+            for proc in procs:
+                proc.wait()
+        except FileNotFoundError:
+            print("astyle not found, {} and {} will not be auto-formatted".format(header_path, source_path))
 
     return malloc_vars.keys(), stateful
 
@@ -123,7 +155,7 @@ def gen_function_reset(function_name):
     return reset_sig, reset_fun
 
 
-def gen_function_initialize(function_name, malloc_vars):
+def gen_function_initialize(function_name, malloc_vars, binary_weights=True, out_dir='.'):
     """Writes an initialize function
 
     Initialize function is used to load variables into memory and do other start up tasks
@@ -131,6 +163,9 @@ def gen_function_initialize(function_name, malloc_vars):
     Args:
         function_name (str): name of main function
         malloc_vars (dict): variables to read in
+        binary_weights (bool): whether to save variables to a single raw little endian float32
+            binary file instead of one .csv text file each
+        out_dir (str): directory to write the weight files to
 
     Returns:
        signature (str): delcaration of the initialization function
@@ -144,17 +179,77 @@ def gen_function_initialize(function_name, malloc_vars):
 
     init_fun = init_sig
     init_fun += ' { \n\n'
-    for key in malloc_vars.keys():
-        fname = function_name + key + ".csv"
-        np.savetxt(fname, malloc_vars[key], fmt="%.8e", delimiter=',')
-        init_fun += '*' + key + " = k2c_read_array(\"" + \
-            fname + "\"," + str(malloc_vars[key].size) + "); \n"
+    if binary_weights:
+        init_fun += gen_weights_blob(function_name, malloc_vars, out_dir)
+    else:
+        init_fun += gen_weights_csv(function_name, malloc_vars, out_dir)
     init_fun += "} \n\n"
 
     return init_sig, init_fun
 
 
-def gen_function_terminate(function_name, malloc_vars):
+def gen_weights_blob(function_name, malloc_vars, out_dir='.'):
+    """Writes all variables to a single binary file and generates code to load them
+
+    Variables are stored back to back as little endian float32, and each one is
+    loaded as a pointer into one block of memory holding the whole file.
+
+    Args:
+        function_name (str): name of main function
+        malloc_vars (dict): variables to write
+        out_dir (str): directory to write the weight file to
+
+    Returns:
+        code (str): body of the initialization function
+    """
+
+    if not malloc_vars:
+        return ''
+    fname = function_name + "_weights.bin"
+    code = ''
+    offset = 0
+    with open(os.path.join(out_dir, fname), 'wb') as f:
+        for key, value in malloc_vars.items():
+            value.astype('<f4', copy=False).tofile(f)
+            code += '*' + key + " = " + function_name + "_weights + " + \
+                str(offset) + "; \n"
+            offset += value.size
+    return "float* " + function_name + "_weights = k2c_load_weights(\"" + \
+        fname + "\"," + str(offset) + "); \n" + code
+
+
+def gen_weights_csv(function_name, malloc_vars, out_dir='.'):
+    """Writes each variable to its own .csv file and generates code to read them
+
+    Args:
+        function_name (str): name of main function
+        malloc_vars (dict): variables to write
+        out_dir (str): directory to write the weight files to
+
+    Returns:
+        code (str): body of the initialization function
+    """
+
+    def save_weights(key):
+        fname = os.path.join(out_dir, function_name + key + ".csv")
+        # format all values in one numpy call rather than per element
+        flat = malloc_vars[key].ravel().astype(np.float32, copy=False)
+        with open(fname, 'wb') as f:
+            f.write(b','.join(np.char.mod(b'%.8e', flat)))
+
+    # weight files are independent, so write them concurrently
+    with ThreadPoolExecutor(max_workers=min(MAX_WRITE_WORKERS,
+                                            len(malloc_vars) or 1)) as executor:
+        list(executor.map(save_weights, malloc_vars.keys()))
+
+    code = ''
+    for key in malloc_vars.keys():
+        code += '*' + key + " = k2c_read_array(\"" + function_name + key + \
+            ".csv\"," + str(malloc_vars[key].size) + "); \n"
+    return code
+
+
+def gen_function_terminate(function_name, malloc_vars, binary_weights=True):
     """Writes a terminate function
 
     Terminate function is used to deallocate memory after completion
@@ -162,6 +257,8 @@ def gen_function_terminate(function_name, malloc_vars):
     Args:
         function_name (str): name of main function
         malloc_vars (dict): variables to deallocate
+        binary_weights (bool): whether variables were loaded from a single
+            binary file by gen_weights_blob
 
     Returns:
        signature (str): delcaration of the terminate function
@@ -175,13 +272,77 @@ def gen_function_terminate(function_name, malloc_vars):
 
     term_fun = term_sig
     term_fun += ' { \n\n'
-    for key in malloc_vars.keys():
-        term_fun += "free(" + key + "); \n"
+    if binary_weights and malloc_vars:
+        # all variables point into one block, which starts at the first one
+        total = sum(value.size for value in malloc_vars.values())
+        term_fun += "k2c_free_weights(" + next(iter(malloc_vars)) + "," + \
+            str(total) + "); \n"
+    elif not binary_weights:
+        for key in malloc_vars.keys():
+            term_fun += "free(" + key + "); \n"
     term_fun += "} \n\n"
 
     return term_sig, term_fun
 
-def k2c(model, function_name, malloc=False, num_tests=10, verbose=True):
+def file_hash(path):
+    """Hashes the contents of a file
+
+    Args:
+        path (str): path to the file
+
+    Returns:
+        digest (str): hex digest of the file contents
+    """
+
+    h = hashlib.blake2b()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+@contextmanager
+def cached_model(path):
+    """Loads a saved model, reusing a recently loaded model if the file contents are the same
+
+    The cache holds at most MODEL_CACHE_SIZE models in each process. A cached
+    model is only handed to one thread at a time, other threads converting the
+    same file wait until it is released.
+
+    Args:
+        path (str): path to saved .h5 model file
+
+    Yields:
+        model (tf.keras.Model): loaded model, valid until the context exits
+    """
+
+    key = file_hash(path)
+    with _model_cache_lock:
+        entry = _model_cache.pop(key, None)
+        if entry is None:
+            entry = {'model': None, 'lock': threading.Lock()}
+        _model_cache[key] = entry
+        while len(_model_cache) > MODEL_CACHE_SIZE:
+            _model_cache.popitem(last=False)
+    with entry['lock']:
+        if entry['model'] is None:
+            entry['model'] = models.load_model(path, compile=False)
+        elif entry['model'].stateful:
+            # a previous conversion may have left state behind
+            entry['model'].reset_states()
+        yield entry['model']
+
+
+def clear_model_cache():
+    """Removes all models from the cache used by cached_model
+    """
+
+    with _model_cache_lock:
+        _model_cache.clear()
+
+
+def k2c(model, function_name, malloc=False, num_tests=10, verbose=True,
+        binary_weights=True, out_dir='.', format_output=False):
     """Converts keras model to C code and generates test suite.
 
     Args:
@@ -190,9 +351,14 @@ def k2c(model, function_name, malloc=False, num_tests=10, verbose=True):
         malloc (bool): Whether to allocate variables on the stack or heap.
         num_tests (int): How many tests to generate in the test suite.
         verbose (bool): Whether to print progress.
+        binary_weights (bool): Whether to save heap allocated weights to a single
+            raw little endian float32 binary file instead of one .csv text file each.
+        out_dir (str): Directory to write generated files to.
+        format_output (bool): Whether to format the generated files with astyle.
 
     Raises:
         ValueError: If model is not an instance of tf.keras.models.Model.
+        AssertionError: If model contains invalid names or unsupported features.
 
     Returns:
         None
@@ -200,26 +366,52 @@ def k2c(model, function_name, malloc=False, num_tests=10, verbose=True):
 
     function_name = str(function_name)
     if isinstance(model, str):
-        model = models.load_model(model, compile=False)
+        with cached_model(model) as loaded:
+            return k2c(loaded, function_name, malloc, num_tests, verbose,
+                       binary_weights, out_dir, format_output)
     elif not isinstance(model, models.Model):
         raise ValueError('Unknown model type. Model should '
                          'either be an instance of tf.keras.models.Model, '
                          'or a filepath to a saved .h5 model')
 
-    # Check that the model can be converted
-    check_model(model, function_name)
-    if verbose:
-        print('All checks passed')
+    # walk the model graph once, shared by the check and code generation
+    metadata = precompute_model_metadata(model)
 
-    malloc_vars, stateful = model2c(model, function_name, malloc, verbose)
+    # The model is checked while the code is generated
+    malloc_vars, stateful = model2c(model, function_name, malloc, verbose,
+                                    binary_weights, metadata, out_dir,
+                                    format_output)
 
     s = 'Done \n'
-    s += f"C code is in '{function_name}.c' with header file '{function_name}.h' \n"
+    out_path = os.path.join(out_dir, function_name)
+    s += f"C code is in '{out_path}.c' with header file '{out_path}.h' \n"
     if num_tests > 0:
         make_test_suite(model, function_name, malloc_vars,
-                        num_tests, stateful, verbose)
-        s += f"Tests are in '{function_name}_test_suite.c' \n"
+                        num_tests, stateful, verbose, out_dir=out_dir,
+                        format_output=format_output)
+        s += f"Tests are in '{out_path}_test_suite.c' \n"
     if malloc:
-        s += "Weight arrays are in .csv files. Place them in the directory from which the main program is run."
+        if binary_weights:
+            s += f"Weight arrays are in '{function_name}_weights.bin' (little endian float32). Place it in the directory from which the main program is run."
+        else:
+            s += "Weight arrays are in .csv files. Place them in the directory from which the main program is run."
     if verbose:
         print(s)
+
+
+def k2c_batch(jobs, **kwargs):
+    """Converts several keras models to C code in one process.
+
+    TensorFlow is imported and initialized once, and then reused for every model.
+
+    Args:
+        jobs (list): (model, function_name) pairs, where model is a tf.keras.Model
+            or a path to a saved .h5 file.
+        **kwargs: Other arguments passed to k2c for every model.
+
+    Returns:
+        None
+    """
+
+    for model, function_name in jobs:
+        k2c(model, function_name, **kwargs)
@@ -8,7 +8,8 @@ Writes individual layers to C code
 """
 
 # imports
-from keras2c.io_parsing import layer_type, get_model_io_names, get_all_io_names, get_layer_io_names, flatten
+from keras2c.io_parsing import layer_type, get_model_io_names, get_all_io_names, get_layer_io_names, \
+    flatten, precompute_model_metadata
 import tensorflow as tf
 # tf.compat.v1.disable_eager_execution()
 # tf.compat.v1.disable_eager_execution()
@@ -27,13 +28,17 @@ class Layers2C():
     Args:
         model (keras Model): model to parse
         malloc (bool): Whether to allocate variables on the heap using malloc.
+        metadata (dict): model metadata from precompute_model_metadata, shared with
+            other passes over the model
     """
 
-    def __init__(self, model, malloc):
+    def __init__(self, model, malloc, metadata=None):
         self.model = model
         self.model_inputs, self.model_outputs = get_model_io_names(self.model)
         self.layers = ''
         self.malloc = malloc
+        self.metadata = metadata if metadata is not None \
+            else precompute_model_metadata(model)
 
     def write_layers(self, verbose=True):
         """Writes layers in the correct graph order.
@@ -45,28 +50,44 @@ class Layers2C():
             layers (str): C code for calling layer functions in correct order
 
         """
-        written_io = set(self.model_inputs)
-        unwritten_io = set(get_all_io_names(self.model)) - written_io
-        layer_inputs, layer_outputs = get_layer_io_names(self.model.layers[0])
+        self.start_layers()
         for layer in self.model.layers:
-            if(layer_inputs == layer_outputs):
-                _, layer_outputs = get_layer_io_names(layer)
-            else:
-                layer_inputs, layer_outputs = get_layer_io_names(layer)
-            for i, (inp, outp) in enumerate(zip(layer_inputs, layer_outputs)):
-                if (1):
-                    if verbose:
-                        print('Writing layer ', layer)
-                    method = getattr(
-                        self, '_write_layer_' + layer_type(layer))
-                    method(layer, inp, outp, i)
-                    written_io |= set(flatten(inp))
-                    written_io |= set(flatten(outp))
-                    unwritten_io -= set(flatten(inp))
-                    unwritten_io -= set(flatten(outp))
-            layer_inputs = layer_outputs 
+            self.write_layer(layer, verbose)
         return self.layers
 
+    def start_layers(self):
+        """Resets the graph walk state before writing layers one at a time with write_layer.
+        """
+        self.written_io = set(self.model_inputs)
+        self.unwritten_io = set(get_all_io_names(self.model, self.metadata)) - self.written_io
+        self.layer_inputs, self.layer_outputs = get_layer_io_names(self.model.layers[0], self.metadata)
+
+    def write_layer(self, layer, verbose=True):
+        """Writes the next layer in graph order.
+
+        Layers must be passed in the order of model.layers, after calling start_layers.
+
+        Args:
+            layer (keras Layer): layer to write
+            verbose (bool): whether to print progress
+        """
+        if(self.layer_inputs == self.layer_outputs):
+            _, self.layer_outputs = get_layer_io_names(layer, self.metadata)
+        else:
+            self.layer_inputs, self.layer_outputs = get_layer_io_names(layer, self.metadata)
+        method = getattr(
+            self, '_write_layer_' + layer_type(layer, self.metadata))
+        for i, (inp, outp) in enumerate(zip(self.layer_inputs, self.layer_outputs)):
+            if (1):
+                if verbose:
+                    print('Writing layer ', layer)
+                method(layer, inp, outp, i)
+                self.written_io |= set(flatten(inp))
+                self.written_io |= set(flatten(outp))
+                self.unwritten_io -= set(flatten(inp))
+                self.unwritten_io -= set(flatten(outp))
+        self.layer_inputs = self.layer_outputs
+
     def _format_io_names(self, layer, inp, outp, model_io=False):
         nm = layer.name
         pnm = '&' + nm
@@ -171,14 +192,15 @@ class Layers2C():
             nm + '_fwork); \n'
 
     def _write_layer_Conv(self, layer, inputs, outputs, i):
+        ltype = layer_type(layer)
         nm, pnm, inputs, outputs = self._format_io_names(
             layer, inputs, outputs)
         activation = 'k2c_' + layer.get_config()['activation']
-        if layer_type(layer)[-2:] == '1D':
+        if ltype[-2:] == '1D':
             fname = 'k2c_conv1d('
-        elif layer_type(layer)[-2:] == '2D':
+        elif ltype[-2:] == '2D':
             fname = 'k2c_conv2d('
-        elif layer_type(layer)[-2:] == '3D':
+        elif ltype[-2:] == '3D':
             fname = 'k2c_conv3d('
         if layer.get_config()['padding'] == 'valid':
             self.layers += fname + outputs + ',' + inputs + ',' + \
@@ -208,15 +230,16 @@ class Layers2C():
         self._write_layer_Pooling(layer, inputs, outputs, i)
 
     def _write_layer_Pooling(self, layer, inputs, outputs, i):
+        ltype = layer_type(layer)
         nm, pnm, inputs, outputs = self._format_io_names(
             layer, inputs, outputs)
-        if 'Max' in layer_type(layer):
+        if 'Max' in ltype:
             s = 'k2c_maxpool'
         else:
             s = 'k2c_avgpool'
-        if layer_type(layer)[-2:] == '1D':
+        if ltype[-2:] == '1D':
             s += '1d(' + outputs + ','
-        elif layer_type(layer)[-2:] == '2D':
+        elif ltype[-2:] == '2D':
             s += '2d(' + outputs + ','
 
         if layer.get_config()['padding'] == 'valid':
@@ -254,8 +277,9 @@ class Layers2C():
         self._write_layer_GlobalPooling(layer, inputs, outputs, i)
 
     def _write_layer_GlobalPooling(self, layer, inputs, outputs, i):
+        ltype = layer_type(layer)
         _, _, inputs, outputs = self._format_io_names(layer, inputs, outputs)
-        if 'Max' in layer_type(layer):
+        if 'Max' in ltype:
             self.layers += 'k2c_global_max_pooling('
         else:
             self.layers += 'k2c_global_avg_pooling('
@@ -353,6 +377,7 @@ class Layers2C():
         self._write_layer_AdvancedActivation(layer, inputs, outputs, i)
 
     def _write_layer_AdvancedActivation(self, layer, inputs, outputs, i):
+        ltype = layer_type(layer)
         nm, _, inputs, outputs, is_model_input, is_model_output = self._format_io_names(
             layer, inputs, outputs, True)
         if is_model_input:
@@ -360,19 +385,19 @@ class Layers2C():
         else:
             inp = inputs + '.'
 
-        if layer_type(layer) == 'LeakyReLU':
+        if ltype == 'LeakyReLU':
             self.layers += 'k2c_LeakyReLU(' + inp + 'array,' + \
                 inp + 'numel,' + nm + '_alpha); \n'
-        if layer_type(layer) == 'PReLU':
+        if ltype == 'PReLU':
             self.layers += 'k2c_PReLU(' + inp + 'array,' + inp + \
                 'numel,' + nm + '_alpha.array); \n'
-        if layer_type(layer) == 'ELU':
+        if ltype == 'ELU':
             self.layers += 'k2c_ELU(' + inp + 'array,' + inp + \
                 'numel,' + nm + '_alpha); \n'
-        if layer_type(layer) == 'ThresholdedReLU':
+        if ltype == 'ThresholdedReLU':
             self.layers += 'k2c_ThresholdedReLU(' + inp + 'array,' + \
                 inp + 'numel,' + nm + '_theta); \n'
-        if layer_type(layer) == 'ReLU':
+        if ltype == 'ReLU':
             self.layers += 'k2c_ReLU(' + inp + 'array,' + inp + \
                            'numel,' + nm + '_max_value, \n\t' + \
                            nm + '_negative_slope,' + nm + '_threshold); \n'
@@ -469,13 +494,14 @@ class Layers2C():
         self._write_layer_UpSampling(layer, inputs, outputs, i)
 
     def _write_layer_UpSampling(self, layer, inputs, outputs, i):
+        ltype = layer_type(layer)
         nm, _, inputs, outputs = self._format_io_names(
             layer, inputs, outputs)
-        if layer_type(layer)[-2:] == '1D':
+        if ltype[-2:] == '1D':
             self.layers += 'k2c_upsampling1d('
-        elif layer_type(layer)[-2:] == '2D':
+        elif ltype[-2:] == '2D':
             self.layers += 'k2c_upsampling2d('
-        elif layer_type(layer)[-2:] == '3D':
+        elif ltype[-2:] == '3D':
             self.layers += 'k2c_upsampling3d('
         self.layers += outputs + ',' + inputs + ',' + nm + '_size); \n'
 
@@ -489,13 +515,14 @@ class Layers2C():
         self._write_layer_Cropping(layer, inputs, outputs, i)
 
     def _write_layer_Cropping(self, layer, inputs, outputs, i):
+        ltype = layer_type(layer)
         nm, _, inputs, outputs = self._format_io_names(
             layer, inputs, outputs)
-        if layer_type(layer)[-2:] == '1D':
+        if ltype[-2:] == '1D':
             self.layers += 'k2c_crop1d('
-        elif layer_type(layer)[-2:] == '2D':
+        elif ltype[-2:] == '2D':
             self.layers += 'k2c_crop2d('
-        elif layer_type(layer)[-2:] == '3D':
+        elif ltype[-2:] == '3D':
             self.layers += 'k2c_crop3d('
         self.layers += outputs + ',' + inputs + ',' + nm + '_crop); \n'
 
@@ -509,16 +536,17 @@ class Layers2C():
         self._write_layer_ZeroPad(layer, inputs, outputs, i)
 
     def _write_layer_ZeroPad(self, layer, inputs, outputs, i):
-        if 'Zero' in layer_type(layer):
+        ltype = layer_type(layer)
+        if 'Zero' in ltype:
             nm, _, inputs, outputs = self._format_io_names(
                 layer, inputs, outputs)
         else:
             nm = layer.name
-        if layer_type(layer)[-2:] == '1D':
+        if ltype[-2:] == '1D':
             self.layers += 'k2c_pad1d('
-        elif layer_type(layer)[-2:] == '2D':
+        elif ltype[-2:] == '2D':
             self.layers += 'k2c_pad2d('
-        elif layer_type(layer)[-2:] == '3D':
+        elif ltype[-2:] == '3D':
             self.layers += 'k2c_pad3d('
         self.layers += outputs + ',' + inputs + ',' + nm + \
             '_fill, \n\t' + nm + '_pad); \n'
@@ -13,6 +13,7 @@ from keras2c.io_parsing import get_model_io_names
 from keras2c.weights2c import Weights2C
 import tensorflow as tf
 import subprocess
+import os
 # tf.compat.v1.disable_eager_execution()
 
 __author__ = "Rory Conlin"
@@ -22,14 +23,15 @@ __maintainer__ = "Rory Conlin, https://github.com/f0uriest/keras2c"
 __email__ = "wconlin@princeton.edu"
 
 
-def make_test_suite(model, function_name, malloc_vars, num_tests=10, stateful=False, verbose=True, tol=1e-5):
+def make_test_suite(model, function_name, malloc_vars, num_tests=10, stateful=False, verbose=True, tol=1e-5,
+                    out_dir='.', format_output=False):
     """Generates code to test the generated C function.
 
     Generates random inputs to the model, and gets the corresponding predictions for them.
     Writes input/output pairs to a C file, along with code to call the generated C function
     and compare the true outputs with the outputs from the generated code.
 
-    Writes the test function to a file `<function_name>_test_suite.c`
+    Writes the test function to a file `<function_name>_test_suite.c` in out_dir
 
     Args:
         model (keras Model): model being converted to C
@@ -40,6 +42,8 @@ def make_test_suite(model, function_name, malloc_vars, num_tests=10, stateful=Fa
         verbose (bool): whether to print output
         tol (float): tolerance for passing tests. Tests pass if the maximum error over
             all elements between the true output and generated code output is less than tol.
+        out_dir (str): directory to write the test suite to
+        format_output (bool): whether to format the test suite with astyle
 
     Returns:
         None
@@ -64,7 +68,8 @@ def make_test_suite(model, function_name, malloc_vars, num_tests=10, stateful=Fa
   #  for i in range(num_outputs):
   #      output_shape.insert(i, model.outputs[i].shape[1:])
 
-    file = open(function_name + '_test_suite.c', "w+")
+    test_path = os.path.join(out_dir, function_name + '_test_suite.c')
+    file = open(test_path, "w+")
     s = '#include <stdio.h> \n'
     s += '#include <math.h> \n'
     s += '#include <time.h> \n'
@@ -175,7 +180,8 @@ def make_test_suite(model, function_name, malloc_vars, num_tests=10, stateful=Fa
     return x;}\n\n"""
     file.write(s)
     file.close()
-    try:
-        subprocess.run(['astyle', '-n', function_name + '_test_suite.c'])
-    except FileNotFoundError:
-        print("astyle not found, {} will not be auto-formatted".format(function_name + "_test_suite.c"))
+    if format_output:
+        try:
+            subprocess.run(['astyle', '-n', test_path])
+        except FileNotFoundError:
+            print("astyle not found, {} will not be auto-formatted".format(test_path))
@@ -0,0 +1,86 @@
+"""model_compiler.py
+This file is part of keras2c
+Copyright 2020 Rory Conlin
+Licensed under MIT License
+https://github.com/f0uriest/keras2c
+
+Checks a model and writes its weights and layers in a single pass
+"""
+
+# imports
+from keras2c.io_parsing import precompute_model_metadata
+from keras2c.check_model import is_valid_c_name, check_layer
+from keras2c.weights2c import Weights2C
+from keras2c.layer2c import Layers2C
+
+__author__ = "Rory Conlin"
+__copyright__ = "Copyright 2020, Rory Conlin"
+__license__ = "MIT"
+__maintainer__ = "Rory Conlin, https://github.com/f0uriest/keras2c"
+__email__ = "wconlin@princeton.edu"
+
+
+class ModelCompiler():
+    """Creates an object to check a model and generate code for it in one pass over its layers.
+
+    Each layer is checked, then its weights and its layer call are written,
+    before moving on to the next layer.
+
+    Args:
+        model (keras Model): model to convert
+        function_name (str): name of the function being generated
+        malloc (bool): Whether to allocate variables on the heap using malloc.
+        metadata (dict): model metadata from precompute_model_metadata
+    """
+
+    def __init__(self, model, function_name, malloc=False, metadata=None):
+        self.model = model
+        self.function_name = function_name
+        self.malloc = malloc
+        self.metadata = metadata if metadata is not None \
+            else precompute_model_metadata(model)
+        self.stack_vars = ''
+        self.malloc_vars = {}
+        self.static_vars = ''
+        self.layers_src = ''
+        self.errors = []
+
+    def run(self, verbose=True):
+        """Checks the model and generates code for weights and layers
+
+        Args:
+            verbose (bool): whether to print progress
+
+        Raises:
+            AssertionError: If model contains invalid names or unsupported features
+
+        Returns:
+            self (ModelCompiler): the compiler, with stack_vars, malloc_vars,
+                static_vars and layers_src filled in
+        """
+
+        weights = Weights2C(self.model, self.function_name,
+                            self.malloc, self.metadata)
+        layers = Layers2C(self.model, self.malloc, self.metadata)
+        if not is_valid_c_name(self.function_name):
+            self.errors.append("function name '" + self.function_name +
+                               "' is not a valid C name. \n")
+        layers.start_layers()
+        for layer in self.model.layers:
+            valid, log = check_layer(layer, self.metadata)
+            if not valid:
+                self.errors.append(log)
+            # keep checking the remaining layers, but stop writing code once
+            # an error has been found
+            if not self.errors:
+                weights.write_layer_weights(layer)
+                layers.write_layer(layer, verbose)
+        if self.errors:
+            raise AssertionError('The following errors were found: \n' +
+                                 ''.join(self.errors))
+
+        self.stack_vars = weights.stack_vars
+        self.malloc_vars = weights.malloc_vars
+        self.static_vars = weights.write_static_vars()
+        self.layers_src = layers.layers
+        return self
@@ -9,7 +9,8 @@ Gets weights and other parameters from each layer and writes to C file
 
 # imports
 import numpy as np
-from keras2c.io_parsing import layer_type, get_layer_io_names, get_model_io_names
+from keras2c.io_parsing import layer_type, get_layer_io_names, get_model_io_names, \
+    precompute_model_metadata
 from tensorflow.keras import backend as K
 import tensorflow as tf
 # tf.compat.v1.disable_eager_execution()
@@ -30,9 +31,11 @@ class Weights2C():
         model (keras Model): model to parse
         function_name (str): name of the function being generated
         malloc (bool): Whether to allocate variables on the heap using malloc.
+        metadata (dict): model metadata from precompute_model_metadata, shared with
+            other passes over the model
     """
 
-    def __init__(self, model, function_name, malloc=False):
+    def __init__(self, model, function_name, malloc=False, metadata=None):
 
         self.model = model
         self.function_name = function_name
@@ -41,15 +44,20 @@ class Weights2C():
         self.stack_vars = ''
         self.malloc_vars = {}
         self.static_vars = {}
+        self.metadata = metadata if metadata is not None \
+            else precompute_model_metadata(model)
 
     @staticmethod
-    def array2c(array, name, malloc=False):
+    def array2c(array, name, malloc=False, static=False):
         """Generates C code for a k2c_tensor array type
 
         Args:
             array (array-like): Python array to write
             name (str): name for the C variable
             malloc (bool): whether to allocate on the heap
+            static (bool): whether to store nonzero arrays as static const data,
+                aligned for vector loads, rather than on the stack. Only for arrays
+                that are never written to, such as weights.
 
         Returns:
             arr (str): generated code for the array as a k2c_tensor
@@ -68,39 +76,45 @@ class Weights2C():
             to_malloc.update({name + '_array': temp})
             return s, to_malloc
         else:
-            count = 0
-            s = 'float ' + name + '_array[' + str(size) + '] = '
             if np.max(np.abs(temp)) < 1e-16:
+                s = 'float ' + name + '_array[' + str(size) + '] = '
                 s += '{' + str(0) + '}; \n'
+                ptr = '&' + name + '_array[0]'
             else:
-                s += '{\n'
-                for i in range(size):
-                    if temp[i] == np.inf:
-                        s += "HUGE_VALF,"
-                    elif temp[i] == -np.inf:
-                        s += "-HUGE_VALF,"
-                    else:
-                        s += "{:+.8e}f".format(temp[i]) + ','
-                    count += 1
-                    if (count) % 5 == 0:
-                        s += '\n'
-                s += '}; \n'
-            s += 'k2c_tensor ' + name + ' = {&' + name + \
-                '_array[0],' + str(int(ndim)) + ',' + str(int(size)) + ',{' + \
+                if static:
+                    s = 'static const float ' + name + '_array[' + str(size) + \
+                        '] K2C_ALIGNED = '
+                    ptr = '(float*)&' + name + '_array[0]'
+                else:
+                    s = 'float ' + name + '_array[' + str(size) + '] = '
+                    ptr = '&' + name + '_array[0]'
+                # format all values in one numpy call, 8 per line
+                vals = np.char.mod('%+.8ef', temp)
+                vals = np.where(temp == np.inf, 'HUGE_VALF', vals)
+                vals = np.where(temp == -np.inf, '-HUGE_VALF', vals)
+                s += '{\n' + ',\n'.join(','.join(vals[i:i+8])
+                                         for i in range(0, size, 8)) + ',\n}; \n'
+            s += 'k2c_tensor ' + name + ' = {' + ptr + ',' + str(int(ndim)) + \
+                ',' + str(int(size)) + ',{' + \
                 np.array2string(shp.astype(int), separator=',')[
                     1:-1] + '}}; \n'
             return s
 
     def _write_weights_array2c(self, array, name):
-        temp = self.array2c(array, name, self.malloc)
+        temp = self.array2c(array, name, self.malloc, static=True)
         if self.malloc:
             self.stack_vars += temp[0]
             self.malloc_vars.update(temp[1])
         else:
             self.stack_vars += temp
 
-    def _write_weights_layer(self, layer):
-        method = getattr(self, '_write_weights_' + layer_type(layer))
+    def write_layer_weights(self, layer):
+        """Generates code for the weights of a single layer
+
+        Args:
+            layer (keras Layer): layer to write weights for
+        """
+        method = getattr(self, '_write_weights_' + layer_type(layer, self.metadata))
         return method(layer)
 
     def write_weights(self, verbose=True):
@@ -119,11 +133,16 @@ class Weights2C():
                     (eg, states of a stateful RNN)
         """
         for layer in self.model.layers:
-            method = getattr(self, '_write_weights_' + layer_type(layer))
-            method(layer)
-        return self.stack_vars, self.malloc_vars, self._write_static_vars()
+            self.write_layer_weights(layer)
+        return self.stack_vars, self.malloc_vars, self.write_static_vars()
 
-    def _write_static_vars(self):
+    def write_static_vars(self):
+        """Generates code for the struct of static variables
+
+        Returns:
+            s (str): code for a C struct containing static variables
+                (eg, states of a stateful RNN), or '' if there are none
+        """
         if len(self.static_vars) > 0:
             s = 'static struct ' + self.function_name + '_static_vars \n'
             s += '{ \n'
@@ -135,7 +154,7 @@ class Weights2C():
         return s
 
     def _write_outputs(self, layer):
-        _, outputs = get_layer_io_names(layer)
+        _, outputs = get_layer_io_names(layer, self.metadata)
         if len(outputs) > 1:
             for i, outp in enumerate(outputs):
                 outshp = layer.output[i].shape[1:]
@@ -160,8 +179,8 @@ class Weights2C():
             foo = layer.layer.__call__(temp_input)
             foo = layer.forward_layer.__call__(temp_input)
             foo = layer.backward_layer.__call__(temp_input)
-        self._write_weights_layer(layer.backward_layer)
-        self._write_weights_layer(layer.forward_layer)
+        self.write_layer_weights(layer.backward_layer)
+        self.write_layer_weights(layer.forward_layer)
         if layer.merge_mode:
 
             self._write_outputs(layer)
@@ -176,7 +195,7 @@ class Weights2C():
                     str(ax) + '; \n'
 
         else:
-            output_names = get_layer_io_names(layer)[1][0]
+            output_names = get_layer_io_names(layer, self.metadata)[1][0]
             subname = layer.layer.name
             self.stack_vars += 'k2c_tensor * ' + \
                 output_names[0] + ' = forward_' + subname + '_output; \n'
@@ -191,7 +210,7 @@ class Weights2C():
             temp_input = tf.keras.layers.Input(
                 layer.input.shape[2:], batch_size=1)
             foo = layer.layer.__call__(temp_input)
-        self._write_weights_layer(layer.layer)
+        self.write_layer_weights(layer.layer)
         timeslice_input = np.squeeze(np.zeros(layer.layer.input.shape[1:]))
         timeslice_output = np.squeeze(np.zeros(layer.layer.output_shape[1:]))
         self._write_weights_array2c(
@@ -609,7 +628,7 @@ class Weights2C():
 
     def _write_weights_Merge(self, layer):
         self._write_outputs(layer)
-        inputs, outputs = get_layer_io_names(layer)
+        inputs, outputs = get_layer_io_names(layer, self.metadata)
         for i, (inp, outp) in enumerate(zip(inputs, outputs)):
             num_tensors = len(inp)
             self.stack_vars += 'size_t ' + layer.name + '_num_tensors' + str(i) + \
@@ -617,7 +636,7 @@ class Weights2C():
         self.stack_vars += '\n\n'
 
     def _write_weights_Concatenate(self, layer):
-        inputs, outputs = get_layer_io_names(layer)
+        inputs, outputs = get_layer_io_names(layer, self.metadata)
         for i, (inp, outp) in enumerate(zip(inputs, outputs)):
             outshp = layer.output[i].shape[1:]
             num_tensors = len(inp)
@@ -834,7 +853,7 @@ class Weights2C():
         pass
 
     def _write_weights_Flatten(self, layer):
-        _, outputs = get_layer_io_names(layer)        
+        _, outputs = get_layer_io_names(layer, self.metadata)        
         for i, outp in enumerate(outputs):
             inshp = layer.input[i].shape[1:]
             if outp not in self.model_io[1]:
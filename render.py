@@ -1,7 +1,14 @@
+import io
+import multiprocessing
 import os
 import shutil
+import tempfile
+import threading
+import time
+import uuid
 import zipfile
-from flask import Flask, render_template, request, send_file
+from concurrent.futures import ProcessPoolExecutor
+from flask import Flask, jsonify, render_template, request, send_file
 from keras2c.keras2c_main import *
 
 app = Flask(__name__)
@@ -13,6 +20,21 @@ if not os.path.exists(UPLOAD_FOLDER):
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
+# Folder with the k2c C library shipped alongside the generated code
+K2C_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'k2c')
+
+# Compress the k2c folder once at startup, since it is the same for every request
+def build_k2c_zip(k2c_folder):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        for root, dirs, files in os.walk(k2c_folder):
+            for file in files:
+                file_path = os.path.join(root, file)
+                zipf.write(file_path, os.path.relpath(file_path, os.path.join(k2c_folder, os.pardir)))
+    return buffer.getvalue()
+
+K2C_BASE_ZIP_BYTES = build_k2c_zip(K2C_FOLDER)
+
 # Function to clear all contents in the upload folder
 def clear_upload_folder():
     for filename in os.listdir(UPLOAD_FOLDER):
@@ -25,44 +47,27 @@ def clear_upload_folder():
         except Exception as e:
             print(f"Error deleting {file_path}: {e}")
 
-def cleanup_generated_files():
-    try:
-        # Delete the .c, .h, and .test_suite.c files
-        for filename in os.listdir():
-            if filename.endswith(".c") or filename.endswith(".h"):
-                os.remove(filename)
-                print(f"Deleted {filename}")
-
-       
-    except Exception as e:
-        print(f"Error cleaning up files for {filename}: {e}")
-
 # Function to zip only specific files and the k2c folder
-def create_zip(output_folder, zip_filename, function_name):
-    zip_filepath = os.path.join(UPLOAD_FOLDER, zip_filename)
+def create_zip(output_folder, zip_filepath, function_name):
 
     # List of specific files to include (with dynamic renaming based on function_name)
     files_to_zip = [
         os.path.join(output_folder, f"{function_name}.c"),
         os.path.join(output_folder, f"{function_name}.h"),
         os.path.join(output_folder, f"{function_name}_test_suite.c"),
-        os.path.join(output_folder, "k2c")  # Assuming k2c folder is generated
     ]
-    
-    # Create a Zip file and add only the specified files
+
+    # Start from a copy of the precompressed k2c folder in memory, append the
+    # generated files uncompressed, and write the result out once
     try:
-        with zipfile.ZipFile(zip_filepath, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        buffer = io.BytesIO(K2C_BASE_ZIP_BYTES)
+        buffer.seek(0, io.SEEK_END)
+        with zipfile.ZipFile(buffer, 'a', zipfile.ZIP_STORED) as zipf:
             for file_path in files_to_zip:
                 if os.path.exists(file_path):
-                    # Add the file or folder to the zip
-                    if os.path.isdir(file_path):
-                        # If it's a directory, add its contents
-                        for root, dirs, files in os.walk(file_path):
-                            for file in files:
-                                zipf.write(os.path.join(root, file), os.path.relpath(os.path.join(root, file), output_folder))
-                    else:
-                        # If it's a file, add it directly
-                        zipf.write(file_path, os.path.relpath(file_path, output_folder))
+                    zipf.write(file_path, os.path.relpath(file_path, output_folder))
+        with open(zip_filepath, 'wb') as f:
+            f.write(buffer.getbuffer())
         return zip_filepath
     except Exception as e:
         print(f"Error creating zip file: {e}")
@@ -72,12 +77,61 @@ def create_zip(output_folder, zip_filename, function_name):
 def home():
     return render_template("index.html")
 
+# Conversions run in a bounded pool of worker processes so large models don't block the server.
+# Workers are spawned fresh rather than forked from the threaded server process.
+# Each worker, and the server itself for ?sync=1 uploads, keeps its own cache of up to
+# MODEL_CACHE_SIZE loaded models, so memory grows with the number of workers
+executor = ProcessPoolExecutor(max_workers=int(os.environ.get('CONVERT_WORKERS', 2)),
+                               mp_context=multiprocessing.get_context('spawn'))
+
+# Submitted conversions, job id -> (future, job folder, submit time)
+jobs = {}
+jobs_lock = threading.Lock()
+
+# Seconds a finished job is kept for download before its files are removed
+JOB_TTL = int(os.environ.get('JOB_TTL', 3600))
+
+# Function to remove finished jobs that were never downloaded
+def expire_jobs():
+    now = time.monotonic()
+    with jobs_lock:
+        expired = [job_id for job_id, (future, job_folder, created) in jobs.items()
+                   if future.done() and now - created > JOB_TTL]
+        expired = [(job_id, jobs.pop(job_id)[1]) for job_id in expired]
+    for job_id, job_folder in expired:
+        shutil.rmtree(job_folder, ignore_errors=True)
+
+# Function to convert an uploaded model and zip the generated code, run in a worker process
+def convert_model(filepath, function_name, job_folder):
+    try:
+        # Generate the code in a private temporary folder that is removed once zipped
+        with tempfile.TemporaryDirectory() as generated_folder:
+            # Convert H5 file to C code using the user-provided function name
+            k2c(filepath, function_name, malloc=False, num_tests=1, verbose=True,
+                out_dir=generated_folder, format_output=False)
+
+            # Create a zip file with only the specific files and k2c folder
+            zip_filepath = os.path.join(job_folder, f"{function_name}_output.zip")
+            zip_filepath = create_zip(generated_folder, zip_filepath, function_name)
+    finally:
+        # Delete the original .h5 file after conversion
+        os.remove(filepath)
+
+    # Check if the zip file was created successfully
+    if zip_filepath is None:
+        raise RuntimeError("Error creating zip file.")
+    return zip_filepath
+
+# Function to send a finished zip file and remove the job folder
+def send_zip(job_folder, zip_filepath):
+    with open(zip_filepath, 'rb') as f:
+        data = io.BytesIO(f.read())
+    shutil.rmtree(job_folder, ignore_errors=True)
+    return send_file(data, as_attachment=True, download_name=os.path.basename(zip_filepath))
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
-    # Clear all contents in the upload folder
-    clear_upload_folder()
-    cleanup_generated_files()
-
+    expire_jobs()
     if 'file' not in request.files:
         return "No file part"
     file = request.files['file']
@@ -88,40 +142,76 @@ def upload_file():
     function_name = request.form.get('function_name')  # Get the function name from the form
 
     if file:
-        # Save file to the uploads folder
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
+        # Save file to a folder of its own in the uploads folder
+        job_id = uuid.uuid4().hex
+        job_folder = os.path.join(app.config['UPLOAD_FOLDER'], job_id)
+        os.makedirs(job_folder)
+        filepath = os.path.join(job_folder, file.filename)
         file.save(filepath)
 
-        try:
-            # Convert H5 file to C code using the user-provided function name
-            k2c(filepath, function_name, malloc=False, num_tests=1, verbose=True)
-
-            # Set the folder where the generated files are stored (assuming k2c creates them in the current directory)
-            generated_folder = os.getcwd()  # Assuming k2c generates files in the current working directory
-
-           
-            # Create a zip file with only the specific files and k2c folder
-            zip_filename = f"{function_name}_output.zip"
-            zip_filepath = create_zip(generated_folder, zip_filename, function_name)
-
-            # Check if the zip file was created successfully
-            if zip_filepath is None:
-                return "Error creating zip file."
-
-            # Delete the original .h5 file after conversion
-            os.remove(filepath)
-            # Send the zip file to the user
-            return send_file(zip_filepath, as_attachment=True)
-
-        except Exception as e:
-            return f"Error converting model: {e}"
+        # Convert in this request and send the zip file directly
+        if request.args.get('sync') == '1':
+            try:
+                zip_filepath = convert_model(filepath, function_name, job_folder)
+            except Exception as e:
+                shutil.rmtree(job_folder, ignore_errors=True)
+                return f"Error converting model: {e}"
+            return send_zip(job_folder, zip_filepath)
+
+        # Otherwise convert in the background, the client polls /status and then fetches /download
+        future = executor.submit(convert_model, filepath, function_name, job_folder)
+        with jobs_lock:
+            jobs[job_id] = (future, job_folder, time.monotonic())
+        return jsonify({"job_id": job_id})
+
+@app.route('/status/<job_id>')
+def job_status(job_id):
+    expire_jobs()
+    with jobs_lock:
+        job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"status": "unknown"}), 404
+    future, job_folder, _ = job
+    if not future.done():
+        return jsonify({"status": "pending"})
+    if future.exception() is not None:
+        # Nothing to download for failed jobs, so clean up now
+        with jobs_lock:
+            jobs.pop(job_id, None)
+        shutil.rmtree(job_folder, ignore_errors=True)
+        return jsonify({"status": "error", "error": f"Error converting model: {future.exception()}"})
+    return jsonify({"status": "done"})
+
+@app.route('/download/<job_id>')
+def download(job_id):
+    with jobs_lock:
+        job = jobs.get(job_id)
+        if job is not None and job[0].done():
+            jobs.pop(job_id)
+    if job is None:
+        return "Unknown job", 404
+    future, job_folder, _ = job
+    if not future.done():
+        return "Conversion is still running", 409
+    try:
+        zip_filepath = future.result()
+    except Exception as e:
+        shutil.rmtree(job_folder, ignore_errors=True)
+        return f"Error converting model: {e}"
+    return send_zip(job_folder, zip_filepath)
 
 @app.route('/about')
 def about():
     return render_template('about.html')
 
-# if __name__ == '__main__':
-#     app.run(debug=False)
 if __name__ == "__main__":
-    from waitress import serve
-    serve(app, host="0.0.0.0", port=1000)
\ No newline at end of file
+    # Remove files left over from previous runs
+    clear_upload_folder()
+
+    # Use the Flask dev server with auto reload only when debugging
+    if os.environ.get('FLASK_DEBUG') == '1':
+        app.run(debug=True)
+    else:
+        from waitress import serve
+        serve(app, host="0.0.0.0", port=int(os.environ.get('PORT', 1000)),
+              threads=int(os.environ.get('WAITRESS_THREADS', 8)))